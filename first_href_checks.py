@@ -1,27 +1,53 @@
 import json
-from stats.models import Chapter, Character, TextRef
+from itertools import islice
+from django.db.models import Min
+from stats.models import Chapter, Character, RefType, TextRef
+
+BATCH_SIZE = 500
 
 
 def get_char_missing_first_href():
     with open("./data/characters.json", encoding="utf-8") as fp:
         data = json.load(fp)
-        with open("./char_missing_first_href.csv", "w", encoding="utf-8") as fp:
-            fp.write(
-                f"Character,Wiki URL,Current First Chapter Ref URL,New First Chapter Ref URL\n"
+
+    chapter_urls = dict(
+        Chapter.objects.using("replica").values_list("number", "source_url")
+    )
+
+    with open("./char_missing_first_href.csv", "w", encoding="utf-8") as fp:
+        fp.write(
+            f"Character,Wiki URL,Current First Chapter Ref URL,New First Chapter Ref URL\n"
+        )
+
+        # Look up characters in fixed size batches to bound the size of each query
+        # and of the refs held in memory at once
+        all_names = iter(data)
+        while batch := list(islice(all_names, BATCH_SIZE)):
+            names = list(
+                Character.objects.using("replica")
+                .filter(
+                    ref_type__name__in=batch,
+                    first_chapter_appearance__isnull=True,
+                )
+                .values_list("ref_type__name", flat=True)
             )
-            for i, (name, meta) in enumerate(data.items()):
-                char = Character.objects.get(ref_type__name=name)
-                if char.first_chapter_appearance == None:
-                    href = meta.get("first_href", "")
-                    char_refs = TextRef.objects.filter(type__name=name).order_by(
-                        "chapter__number"
-                    )
-
-                    if char_refs.exists():
-                        first_chapter = char_refs[0].chapter.source_url
-                    else:
-                        first_chapter = ""
-
-                    fp.write(
-                        f"{name},{meta.get('wiki_href', '')},{href},{first_chapter}\n"
-                    )
+
+            # Resolve the first referencing chapter for every character in one query
+            first_chapter_nums: dict[str, int] = dict(
+                TextRef.objects.using("replica")
+                .filter(type__type=RefType.CHARACTER, type__name__in=names)
+                .values("type__name")
+                .annotate(first=Min("chapter_line__chapter__number"))
+                .values_list("type__name", "first")
+            )
+
+            for name in names:
+                meta = data[name]
+                href = meta.get("first_href", "")
+                first_chapter = (
+                    chapter_urls[first_chapter_nums[name]]
+                    if name in first_chapter_nums
+                    else ""
+                )
+
+                fp.write(f"{name},{meta.get('wiki_href', '')},{href},{first_chapter}\n")
@@ -1,5 +1,9 @@
+from types import MappingProxyType
 from django.conf import settings
 
+# Settings are fixed for the lifetime of the process so the context can be shared
+ANALYTICS_CONTEXT = MappingProxyType({"ANALYTICS_ID": settings.ANALYTICS_ID})
+
 
 def analytics(request):
-    return {"ANALYTICS_ID": settings.ANALYTICS_ID}
+    return ANALYTICS_CONTEXT
@@ -2,28 +2,46 @@ from django import forms
 from django.core.cache import cache
 from stats.models import RefType, Chapter
 
-MAX_CHAPTER_NUM = (
-    cache.get_or_set(
-        "MAX_CHAPTER_NUM",
-        int(Chapter.objects.values_list("number").order_by("-number")[0][0]),
-        60 * 60 * 24,
-    )
-    or 0
-)
+CHAPTER_CACHE_TIME = 60 * 60 * 24
+# Bounds for table page sizes so a single request only renders a page of rows
+MIN_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
 
 
 def get_chapters():
     yield (0, "--- First Chapter ---")
     i = 0
     for tup in (
-        (c["number"], c["title"])
-        for c in Chapter.objects.values("number", "title").order_by("number")
+        Chapter.objects.values_list("number", "title")
+        .order_by("number")
+        .iterator(chunk_size=2000)
     ):
         i += 1
         yield tup
     yield (i, "--- Last Chapter ---")
 
 
+def get_chapter_choices() -> tuple[tuple[int, str], ...]:
+    """Chapter choices for the chapter filter forms. These are evaluated on form
+    instantiation rather than at import and invalidated whenever a `Chapter` changes.
+    The choices are an immutable tuple so every field can share the same object
+    """
+    return cache.get_or_set(
+        "CHAPTER_CHOICES", lambda: tuple(get_chapters()), CHAPTER_CACHE_TIME
+    )
+
+
+def get_last_chapter_choice() -> int:
+    return len(get_chapter_choices()) - 2
+
+
+def get_max_chapter_num() -> int:
+    """Return the highest chapter number, read from the cached chapter choices"""
+    choices = get_chapter_choices()
+    # The final chapter is the choice right before the "Last Chapter" marker
+    return choices[-2][0] if len(choices) > 2 else 0
+
+
 select_input_tailwind_classes = "bg-bg-primary text-text-primary border-none"
 select_input_styles = "max-width: 15rem"
 checkbox_tailwind_classes = "bg-bg-tertiary"
@@ -31,12 +49,10 @@ integer_input_tailwind_classes = "bg-bg-tertiary"
 
 
 class ChapterFilterForm(forms.Form):
-    chapter_choices = list(get_chapters())
-    max_choice = len(chapter_choices) - 2
-
     first_chapter = forms.TypedChoiceField(
         label="First Chapter",
-        choices=chapter_choices,
+        choices=get_chapter_choices,
+        coerce=int,
         required=False,
         initial=0,
         widget=forms.Select(
@@ -46,9 +62,10 @@ class ChapterFilterForm(forms.Form):
 
     last_chapter = forms.TypedChoiceField(
         label="Last Chapter",
-        choices=chapter_choices,
+        choices=get_chapter_choices,
+        coerce=int,
         required=False,
-        initial=max_choice,
+        initial=get_last_chapter_choice,
         widget=forms.Select(
             attrs={"class": select_input_tailwind_classes, "style": select_input_styles}
         ),
@@ -66,12 +83,10 @@ class SearchForm(forms.Form):
 
     text_query = forms.CharField(label="Text Query", max_length=100, required=False)
 
-    chapter_choices = list(get_chapters())
-    max_choice = len(chapter_choices) - 2
-
     first_chapter = forms.TypedChoiceField(
         label="First Chapter",
-        choices=chapter_choices,
+        choices=get_chapter_choices,
+        coerce=int,
         required=True,
         initial=0,
         widget=forms.Select(attrs={"class": select_input_tailwind_classes}),
@@ -79,9 +94,10 @@ class SearchForm(forms.Form):
 
     last_chapter = forms.TypedChoiceField(
         label="Last Chapter",
-        choices=chapter_choices,
+        choices=get_chapter_choices,
+        coerce=int,
         required=True,
-        initial=max_choice,
+        initial=get_last_chapter_choice,
         widget=forms.Select(attrs={"class": select_input_tailwind_classes}),
     )
 
@@ -89,8 +105,8 @@ class SearchForm(forms.Form):
         label="Page size",
         required=False,
         initial=15,
-        min_value=10,
-        max_value=9999,
+        min_value=MIN_PAGE_SIZE,
+        max_value=MAX_PAGE_SIZE,
         widget=forms.NumberInput(
             attrs={"class": integer_input_tailwind_classes, "style": "width: 5rem"}
         ),
@@ -5,7 +5,6 @@ Django settings for innverse project.
 from pathlib import Path
 from os import environ as env
 from dotenv import load_dotenv
-import pymemcache  # type: ignore[import-untyped]
 from typing import Any
 
 load_dotenv()
@@ -37,13 +36,11 @@ INSTALLED_APPS = [
     "stats",
     "tailwind",
     "theme",
-    "django_browser_reload",
     "pattern_library",
     "django_tables2",
     "django_htmx",
 ]
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -51,7 +48,6 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "django_browser_reload.middleware.BrowserReloadMiddleware",
     "django_htmx.middleware.HtmxMiddleware",
 ]
 
@@ -63,6 +59,11 @@ if DEBUG:
     INSTALLED_APPS.append("debug_toolbar")
     INSTALLED_APPS.append("template_profiler_panel")
     INSTALLED_APPS.append("pyflame")
+    INSTALLED_APPS.append("django_browser_reload")
+    # Development middleware is only added in debug mode so production requests
+    # don't pass through it
+    MIDDLEWARE.insert(0, "debug_toolbar.middleware.DebugToolbarMiddleware")
+    MIDDLEWARE.append("django_browser_reload.middleware.BrowserReloadMiddleware")
 
 ROOT_URLCONF = "innverse.urls"
 
@@ -109,7 +110,6 @@ ASGI_APPLICATION = "innverse.asgi.application"
 
 
 # Database
-CONN_MAX_AGE = 30
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -118,8 +118,18 @@ DATABASES = {
         "PASSWORD": env.get("TWI_DB_PASS", "password"),
         "HOST": env.get("TWI_DB_HOST", "127.0.0.1"),
         "PORT": env.get("TWI_DB_PORT", "5432"),
+        # The site is served with ASGI where persistent connections aren't closed
+        # reliably, so they're disabled unless a pooler like PgBouncer sits in front
+        "CONN_MAX_AGE": int(env.get("TWI_DB_CONN_MAX_AGE", 0)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
+# Read-only replica for reporting jobs. Defaults to the primary database
+DATABASES["replica"] = DATABASES["default"] | {
+    "HOST": env.get("TWI_DB_REPLICA_HOST", DATABASES["default"]["HOST"]),
+    "PORT": env.get("TWI_DB_REPLICA_PORT", DATABASES["default"]["PORT"]),
+    "TEST": {"MIRROR": "default"},
+}
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -236,10 +246,15 @@ LOGGING = {
 TWIKI_BOT_USER = env.get("PYWIKIBOT_USER")
 TWIKI_BOT_NAME = env.get("PYWIKIBOT_BOT_NAME")
 TWIKI_BOT_PASS = env.get("PYWIKIBOT_PASS")
-with open("user-password.py", "w", encoding="utf-8") as fp:
-    fp.write(
-        f"('en', 'twi', {TWIKI_BOT_USER}, BotPassword('{TWIKI_BOT_NAME}', '{TWIKI_BOT_PASS}'))"
-    )
+if TWIKI_BOT_USER and TWIKI_BOT_NAME and TWIKI_BOT_PASS:
+    # Only rewrite the bot password file when its contents change
+    user_password = f"('en', 'twi', {TWIKI_BOT_USER}, BotPassword('{TWIKI_BOT_NAME}', '{TWIKI_BOT_PASS}'))"
+    user_password_path = Path("user-password.py")
+    if (
+        not user_password_path.exists()
+        or user_password_path.read_text(encoding="utf-8") != user_password
+    ):
+        user_password_path.write_text(user_password, encoding="utf-8")
 
 
 # Analytics env
@@ -253,7 +268,10 @@ if PROD:
     CSRF_COOKIE_SECURE = True
 
 
-DISABLE_CACHE = env.get("TWI_DISABLE_CACHE", False)
+TWI_DISABLE_CACHE = env.get("TWI_DISABLE_CACHE")
+DISABLE_CACHE = TWI_DISABLE_CACHE is not None and (
+    TWI_DISABLE_CACHE == "1" or TWI_DISABLE_CACHE.lower() == "true"
+)
 CACHES: dict[str, str | dict[str, Any] | int | bool] = {}
 if DISABLE_CACHE:
     CACHES = {
@@ -262,13 +280,16 @@ if DISABLE_CACHE:
         }
     }
 else:
-    if TWI_PROD:
+    # Use the shared memcached backend in production, or whenever a cache server is
+    # configured, so every worker process shares one cache instead of its own copy
+    TWI_CACHE_URI = env.get("TWI_CACHE_URI")
+    if PROD or TWI_CACHE_URI:
+        import pymemcache.serde  # type: ignore[import-untyped]
+
         CACHES = {
             "default": {
-                # "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-                # "LOCATION": "twi-stats-cache",
                 "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
-                "LOCATION": env.get("TWI_CACHE_URI", "127.0.0.1:11211"),
+                "LOCATION": TWI_CACHE_URI or "127.0.0.1:11211",
                 "TIMEOUT": 300,
                 "OPTIONS": {
                     "no_delay": True,
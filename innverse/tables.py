@@ -1,11 +1,12 @@
-import string
-from django.core.validators import EMPTY_VALUES
-from django.db.models import F, Q
+from django.db.models import F
 from django.db.models.query import QuerySet
 from django.urls import NoReverseMatch, reverse
+from django.utils.encoding import force_str
 from django.utils.text import slugify
 from django.utils.html import strip_tags
 from django.template.loader import render_to_string
+from functools import lru_cache
+from typing import Iterable
 from urllib.parse import quote
 import django_tables2 as tables
 from stats.models import Chapter, Character, RefType, TextRef
@@ -14,6 +15,23 @@ from stats.models import Chapter, Character, RefType, TextRef
 EMPTY_TABLE_TEXT = "No results found for the given query"
 
 
+@lru_cache(maxsize=4096)
+def get_stats_url(ref_type: str, name: str) -> str:
+    """URL of the stats page for a RefType. Search results repeat the same RefTypes
+    across many rows, so the slug and reversed URL are memoized"""
+    return reverse(f"{ref_type.lower()}-stats", args=[slugify(name)])
+
+
+@lru_cache(maxsize=4096)
+def get_chapter_url(number: int) -> str:
+    return reverse("chapters", args=[number])
+
+
+@lru_cache(maxsize=4096)
+def get_slug(name: str) -> str:
+    return slugify(name, allow_unicode=True)
+
+
 class TextRefTable(tables.Table):
     ref_name = tables.Column(
         accessor="type__name", attrs={"th": {"style": "width: 20%;"}}
@@ -36,16 +54,19 @@ class TextRefTable(tables.Table):
         return self._hidden_cols
 
     @hidden_cols.setter
-    def hidden_cols(self, cols: list[int]):
-        self._hidden_cols = cols
+    def hidden_cols(self, cols: Iterable[int]):
+        self._hidden_cols = frozenset(cols)
 
     def __init__(self, *args, **kwargs):
+        if args and isinstance(args[0], QuerySet):
+            # Every row renders its RefType, chapter line and chapter
+            args = (args[0].select_related("type", "chapter_line__chapter"), *args[1:])
         super().__init__(*args)
-        self._hidden_cols = []
-        if hide_cols := kwargs.get("hidden_cols"):
-            self._hidden_cols = hide_cols
+        self._hidden_cols = frozenset(kwargs.get("hidden_cols") or ())
 
     def before_render(self, request):
+        if not self._hidden_cols:
+            return
         for i, col in enumerate(self.columns):
             if i in self._hidden_cols:
                 self.columns.hide(col.name)
@@ -58,19 +79,17 @@ class TextRefTable(tables.Table):
 
     def render_ref_name(self, record: TextRef, value):
         try:
-            path = f"{record.type.type.lower()}-stats"
             return render_to_string(
                 "patterns/atoms/link/stat_link.html",
                 context=dict(
                     text=f"{value}",
-                    href=reverse(path, args=[slugify(value)]),
+                    href=get_stats_url(record.type.type, value),
                 ),
             )
         except NoReverseMatch:
             return record.type.name
 
     def render_text(self, record: TextRef):
-        name = record.type.name
         text = record.chapter_line.text
         first = strip_tags(text[: record.start_column])
         highlight = text[record.start_column : record.end_column]
@@ -85,22 +104,16 @@ class TextRefTable(tables.Table):
         # Using the full text or a strict character count appears to run into issues when linking
         # with a TextFragment, either with too long URLs or unfinished words
         offset = 25
-        fragment_start = (
-            record.start_column - offset if record.start_column > offset else 0
-        )
-        fragment_end = (
-            record.end_column + offset
-            if len(record.chapter_line.text) > record.end_column + offset
-            else len(record.chapter_line.text) - 1
-        )
+        text = record.chapter_line.text
+        text_len = len(text)
+        fragment_start = max(record.start_column - offset, 0)
+        fragment_end = min(record.end_column + offset, text_len - 1)
         front_word_cutoff_cnt = 0 if fragment_start == 0 else 1
-        end_word_cutoff_cnt = (
-            len(record.chapter_line.text)
-            if fragment_end == len(record.chapter_line.text) - 1
-            else -1
-        )
+        end_word_cutoff_cnt = text_len if fragment_end == text_len - 1 else -1
 
-        source_url_with_fragment = f'{value}#:~:text={quote(" ".join(strip_tags(record.chapter_line.text[fragment_start:fragment_end]).split(" ")[front_word_cutoff_cnt:end_word_cutoff_cnt]))}'
+        fragment_words = strip_tags(text[fragment_start:fragment_end]).split(" ")
+        fragment = " ".join(fragment_words[front_word_cutoff_cnt:end_word_cutoff_cnt])
+        source_url_with_fragment = f"{value}#:~:text={quote(fragment)}"
 
         return render_to_string(
             "patterns/atoms/link/link.html",
@@ -111,6 +124,36 @@ class TextRefTable(tables.Table):
             },
         )
 
+    # Export values of each column, read straight from the queryset
+    export_lookups = {
+        "ref_name": "type__name",
+        "chapter_url": "chapter_line__chapter__source_url",
+        "text": "chapter_line__text",
+    }
+
+    def as_values(self, exclude_columns=None):
+        """Export the rows with `values_list` instead of building a `TextRef` and
+        its related models for every exported row"""
+        data = self.data.data
+        if not isinstance(data, QuerySet):
+            yield from super().as_values(exclude_columns)
+            return
+
+        exclude_columns = exclude_columns or ()
+        columns = [
+            column
+            for column in self.columns.iterall()
+            if not (column.column.exclude_from_export or column.name in exclude_columns)
+        ]
+        yield [force_str(column.header, strings_only=True) for column in columns]
+
+        lookups = [self.export_lookups[column.name] for column in columns]
+        for row in data.values_list(*lookups).iterator(chunk_size=2000):
+            yield [
+                strip_tags(value) if column.name == "text" else value
+                for column, value in zip(columns, row)
+            ]
+
     def value_ref_name(self, record: TextRef) -> str:
         return record.type.name
 
@@ -139,16 +182,16 @@ class ChapterRefTable(tables.Table):
         return self._hidden_cols
 
     @hidden_cols.setter
-    def hidden_cols(self, cols: list[int]):
-        self._hidden_cols = cols
+    def hidden_cols(self, cols: Iterable[int]):
+        self._hidden_cols = frozenset(cols)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args)
-        self._hidden_cols = []
-        if hide_cols := kwargs.get("hidden_cols"):
-            self._hidden_cols = hide_cols
+        self._hidden_cols = frozenset(kwargs.get("hidden_cols") or ())
 
     def before_render(self, request):
+        if not self._hidden_cols:
+            return
         for i, col in enumerate(self.columns):
             if i in self._hidden_cols:
                 self.columns.hide(col.name)
@@ -160,29 +203,21 @@ class ChapterRefTable(tables.Table):
 
     def render_ref_name(self, record: dict, value):
         try:
-            path = f"{record['type'].lower()}-stats"
             return render_to_string(
                 "patterns/atoms/link/stat_link.html",
                 context=dict(
                     text=f"{value}",
-                    href=reverse(path, args=[slugify(value)]),
+                    href=get_stats_url(record["type"], value),
                 ),
             )
         except NoReverseMatch:
             return value
 
     def render_chapters(self, record):
-        return ", ".join(
-            [
-                render_to_string(
-                    "patterns/atoms/inline_ref/inline_ref.html",
-                    context={
-                        "text": f"{chapter[0]}",
-                        "href": f"{chapter[1]}",
-                    },
-                )
-                for chapter in record["chapter_data"].order_by("chapter_id")
-            ]
+        # Render every chapter link of the row in one template pass
+        return render_to_string(
+            "patterns/molecules/inline_ref_list/inline_ref_list.html",
+            context={"refs": record["chapter_data"]},
         )
 
     def value_chapters(self, record) -> str:
@@ -202,14 +237,15 @@ class ReftypeMentionsHtmxTable(tables.Table):
             "patterns/atoms/link/stat_link.html",
             context={
                 "text": f"{value}",
-                "href": f"{slugify(value, allow_unicode=True)}",
+                "href": get_slug(value),
             },
         )
 
     def order_mentions(self, queryset, is_descending):
-        queryset = queryset.annotate(
-            mentions=F("reftypecomputedview__mentions")
-        ).order_by(
+        # The views already annotate the mentions, so only add the join if missing
+        if "mentions" not in queryset.query.annotations:
+            queryset = queryset.annotate(mentions=F("reftypecomputedview__mentions"))
+        queryset = queryset.order_by(
             F("mentions").desc(nulls_last=True)
             if is_descending
             else F("mentions").asc()
@@ -249,12 +285,25 @@ class CharacterHtmxTable(tables.Table):
 
     species = tables.Column(attrs={"th": {"style": "width: 8rem; max-width: 12rem;"}})
 
+    def __init__(self, *args, **kwargs):
+        if args and isinstance(args[0], QuerySet):
+            # Every row renders its RefType, mentions and first appearance
+            args = (
+                args[0].select_related(
+                    "ref_type",
+                    "ref_type__reftypecomputedview",
+                    "first_chapter_appearance",
+                ),
+                *args[1:],
+            )
+        super().__init__(*args, **kwargs)
+
     def render_name(self, record: Character, value):
         return render_to_string(
             "patterns/atoms/link/stat_link.html",
             context={
                 "text": f"{value}",
-                "href": f"{slugify(value, allow_unicode=True)}",
+                "href": get_slug(value),
             },
         )
 
@@ -263,7 +312,7 @@ class CharacterHtmxTable(tables.Table):
             "patterns/atoms/link/stat_link.html",
             context={
                 "text": f"{value.title}",
-                "href": reverse("chapters", args=[value.number]),
+                "href": get_chapter_url(value.number),
             },
         )
 
@@ -278,9 +327,11 @@ class CharacterHtmxTable(tables.Table):
         )
 
     def order_mentions(self, queryset, is_descending):
-        queryset = queryset.annotate(
-            mentions=F("ref_type__reftypecomputedview__mentions")
-        ).order_by(
+        if "mentions" not in queryset.query.annotations:
+            queryset = queryset.annotate(
+                mentions=F("ref_type__reftypecomputedview__mentions")
+            )
+        queryset = queryset.order_by(
             F("mentions").desc(nulls_last=True)
             if is_descending
             else F("mentions").asc()
@@ -289,9 +340,11 @@ class CharacterHtmxTable(tables.Table):
         return (queryset, True)
 
     def order_first_appearance(self, queryset, is_descending):
-        queryset = queryset.annotate(
-            chapter_num=F("first_chapter_appearance__number")
-        ).order_by(
+        if "chapter_num" not in queryset.query.annotations:
+            queryset = queryset.annotate(
+                chapter_num=F("first_chapter_appearance__number")
+            )
+        queryset = queryset.order_by(
             F("chapter_num").desc(nulls_last=True)
             if is_descending
             else F("chapter_num").asc()
@@ -319,7 +372,7 @@ class ChapterHtmxTable(tables.Table):
             "patterns/atoms/link/stat_link.html",
             context={
                 "text": f"{value}",
-                "href": reverse("chapters", args=[record.number]),
+                "href": get_chapter_url(record.number),
             },
         )
 
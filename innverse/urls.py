@@ -56,12 +56,20 @@ urlpatterns = [
     # Plugins
     path("admin/", admin.site.urls),
     path("stats/", include("stats.urls")),
-    path("__debug__/", include("debug_toolbar.urls")),
-    path("__reload__", include("django_browser_reload.urls")),
 ]
 # fmt: on
 
 
+if apps.is_installed("debug_toolbar"):
+    urlpatterns += [
+        path("__debug__/", include("debug_toolbar.urls")),
+    ]
+
+if apps.is_installed("django_browser_reload"):
+    urlpatterns += [
+        path("__reload__", include("django_browser_reload.urls")),
+    ]
+
 if apps.is_installed("pattern_library"):
     urlpatterns += [
         path("pattern-library/", include("pattern_library.urls")),
@@ -9,11 +9,20 @@ from django_tables2 import RequestConfig
 from django_tables2.export.export import TableExport
 from django.urls import NoReverseMatch, reverse
 import datetime as dt
-from itertools import chain
+from itertools import chain, groupby
+from operator import itemgetter
 from typing import Iterable, Tuple
 from stats import charts
 from stats.charts import ChartGalleryItem, get_reftype_gallery
-from stats.models import Alias, Chapter, Character, RefType, RefTypeChapter, TextRef
+from stats.models import (
+    Alias,
+    Chapter,
+    ChapterLine,
+    Character,
+    RefType,
+    RefTypeChapter,
+    TextRef,
+)
 from .tables import (
     ChapterRefTable,
     TextRefTable,
@@ -21,7 +30,62 @@ from .tables import (
     CharacterHtmxTable,
     ReftypeMentionsHtmxTable,
 )
-from .forms import ChapterFilterForm, SearchForm, MAX_CHAPTER_NUM
+from .forms import (
+    MAX_PAGE_SIZE,
+    MIN_PAGE_SIZE,
+    ChapterFilterForm,
+    SearchForm,
+    get_max_chapter_num,
+)
+
+
+# Base querysets for the character and RefType tables. These are built once and
+# cloned by each request with `.all()` or `.filter()`, never evaluated directly
+CHARACTER_TABLE_QUERYSET = (
+    Character.objects.select_related(
+        "ref_type", "ref_type__reftypecomputedview", "first_chapter_appearance"
+    )
+    .annotate(
+        mentions=F("ref_type__reftypecomputedview__mentions"),
+        chapter_num=F("first_chapter_appearance__number"),
+    )
+    .order_by(F("mentions").desc(nulls_last=True))
+)
+REFTYPE_TABLE_QUERYSET = RefType.objects.annotate(
+    mentions=F("reftypecomputedview__mentions")
+)
+
+# Lowercased (short-code, code, label) triples used to resolve a search query to
+# species and status short-codes without scanning the choice lists on every request
+SPECIES_LOOKUP = tuple(
+    (code, code.lower(), label.lower()) for code, label in Character.SPECIES
+)
+STATUS_LOOKUP = tuple(
+    (code, code.lower(), label.lower()) for code, label in Character.STATUSES
+)
+
+
+def match_choice_codes(
+    query: str, lookup: tuple[tuple[str, str, str], ...]
+) -> list[str]:
+    """Return the short-codes whose code or label contains `query`"""
+    query = query.lower()
+    return [
+        code
+        for code, lower_code, label in lookup
+        if query in lower_code or query in label
+    ]
+
+
+def get_page_size(request: HttpRequest, default: int = 25) -> int:
+    """Return the requested table page size, bounded to the same range as the
+    `SearchForm` page size. Invalid values fall back to `default`
+    """
+    try:
+        page_size = int(request.GET.get("page_size", default))
+    except ValueError:
+        return default
+    return min(max(page_size, MIN_PAGE_SIZE), MAX_PAGE_SIZE)
 
 
 class HtmxHttpRequest(HttpRequest):
@@ -90,7 +154,7 @@ def overview(request: HtmxHttpRequest) -> HttpResponse:
     config.configure(table)
     table.paginate(
         page=request.GET.get("page", 1),
-        per_page=request.GET.get("page_size", 25),
+        per_page=get_page_size(request),
         orphans=5,
     )
 
@@ -263,35 +327,23 @@ def overview(request: HtmxHttpRequest) -> HttpResponse:
 
 def characters(request: HtmxHttpRequest) -> HttpResponse:
     config = RequestConfig(request)
-    query = request.GET.get("q")
+    # Whitespace-only queries are treated as no query so they skip the filters
+    query = request.GET.get("q", "").strip()
     if query:
-        data = (
-            Character.objects.select_related(
-                "ref_type", "ref_type__reftypecomputedview", "first_chapter_appearance"
-            )
-            .filter(
-                Q(ref_type__name__icontains=query)
-                | Q(species__icontains=query)
-                | Q(status__icontains=query)
-                | Q(first_chapter_appearance__title__icontains=query)
-            )
-            .annotate(mentions=F("ref_type__reftypecomputedview__mentions"))
-            .order_by(F("mentions").desc(nulls_last=True))
+        data = CHARACTER_TABLE_QUERYSET.filter(
+            Q(ref_type__name__icontains=query)
+            | Q(species__in=match_choice_codes(query, SPECIES_LOOKUP))
+            | Q(status__in=match_choice_codes(query, STATUS_LOOKUP))
+            | Q(first_chapter_appearance__title__icontains=query)
         )
     else:
-        data = (
-            Character.objects.select_related(
-                "ref_type", "ref_type__reftypecomputedview", "first_chapter_appearance"
-            )
-            .annotate(mentions=F("ref_type__reftypecomputedview__mentions"))
-            .order_by(F("mentions").desc(nulls_last=True))
-        )
+        data = CHARACTER_TABLE_QUERYSET.all()
 
     table = CharacterHtmxTable(data)
     config.configure(table)
     table.paginate(
         page=request.GET.get("page", 1),
-        per_page=request.GET.get("page_size", 25),
+        per_page=get_page_size(request),
         orphans=5,
     )
 
@@ -367,19 +419,14 @@ def characters(request: HtmxHttpRequest) -> HttpResponse:
 def get_reftype_table_data(
     query: str | None, rt_type: str, order_by="mentions"
 ) -> QuerySet[RefType]:
+    query = query.strip() if query else None
     if query:
-        rt_data = (
-            RefType.objects.select_related("reftypecomputedview")
-            .annotate(mentions=F("reftypecomputedview__mentions"))
-            .filter(type=rt_type, name__icontains=query)
-            .order_by(F(order_by).desc(nulls_last=True))
-        )
+        rt_data = REFTYPE_TABLE_QUERYSET.filter(
+            type=rt_type, name__icontains=query
+        ).order_by(F(order_by).desc(nulls_last=True))
     else:
-        rt_data = (
-            RefType.objects.select_related("reftypecomputedview")
-            .annotate(mentions=F("reftypecomputedview__mentions"))
-            .filter(type=rt_type)
-            .order_by(F("mentions").desc(nulls_last=True))
+        rt_data = REFTYPE_TABLE_QUERYSET.filter(type=rt_type).order_by(
+            F("mentions").desc(nulls_last=True)
         )
 
     return rt_data
@@ -394,7 +441,7 @@ def classes(request: HtmxHttpRequest) -> HttpResponse:
     config.configure(table)
     table.paginate(
         page=request.GET.get("page", 1),
-        per_page=request.GET.get("page_size", 25),
+        per_page=get_page_size(request),
         orphans=5,
     )
 
@@ -487,7 +534,7 @@ def skills(request: HtmxHttpRequest) -> HttpResponse:
     config.configure(table)
     table.paginate(
         page=request.GET.get("page", 1),
-        per_page=request.GET.get("page_size", 25),
+        per_page=get_page_size(request),
         orphans=5,
     )
 
@@ -579,7 +626,7 @@ def magic(request: HtmxHttpRequest) -> HttpResponse:
     config.configure(table)
     table.paginate(
         page=request.GET.get("page", 1),
-        per_page=request.GET.get("page_size", 25),
+        per_page=get_page_size(request),
         orphans=5,
     )
 
@@ -671,7 +718,7 @@ def locations(request: HtmxHttpRequest) -> HttpResponse:
     config.configure(table)
     table.paginate(
         page=int(request.GET.get("page", 1)),
-        per_page=request.GET.get("page_size", 25),
+        per_page=get_page_size(request),
         orphans=5,
     )
 
@@ -744,7 +791,7 @@ def chapter_stats(request: HtmxHttpRequest, number: int) -> HttpResponse:
 
     table.paginate(
         page=int(request.GET.get("page", 1)),
-        per_page=request.GET.get("page_size", 25),
+        per_page=get_page_size(request),
         orphans=5,
     )
 
@@ -986,7 +1033,7 @@ def reftype_stats(request: HtmxHttpRequest, name: str):
     config.configure(table)
     table.paginate(
         page=int(request.GET.get("page", 1)),
-        per_page=request.GET.get("page_size", 15),
+        per_page=get_page_size(request, 15),
         orphans=5,
     )
 
@@ -1080,26 +1127,30 @@ def get_search_result_table(query: dict[str, str]) -> ChapterRefTable | TextRefT
     strict_mode = query.get("strict_mode")
     query_filter = query.get("filter")
     if query.get("refs_by_chapter"):
-        if strict_mode:
-            ref_types: QuerySet[RefType] = RefType.objects.filter(
-                Q(name=query.get("type_query")) & Q(type=query.get("type"))
-            )
-        else:
-            ref_types: QuerySet[RefType] = RefType.objects.filter(
-                Q(name__icontains=query.get("type_query")) & Q(type=query.get("type"))
-            )
+        # A RefType type is required, otherwise every RefType's chapters would be
+        # grouped and held in memory for a single page of results
+        reftype = query.get("type")
+        if not reftype:
+            return ChapterRefTable([])
+
+        # Filter on the type and name together in a single query
+        type_query = query.get("type_query") or ""
+        name_filter = (
+            Q(name=type_query) if strict_mode else Q(name__icontains=type_query)
+        )
+        ref_types: QuerySet[RefType] = RefType.objects.filter(
+            Q(type=reftype) & name_filter
+        )
+
+        # Only look up the (cached) final chapter when no last chapter was given
+        last_chapter = query.get("last_chapter")
+        if last_chapter is None:
+            last_chapter = get_max_chapter_num()
 
         reftype_chapters = RefTypeChapter.objects.filter(
             Q(type__in=ref_types)
             & Q(chapter__number__gte=query.get("first_chapter"))
-            & Q(
-                chapter__number__lte=query.get(
-                    "last_chapter",
-                    int(
-                        Chapter.objects.values_list("number").order_by("-number")[0][0]
-                    ),
-                )
-            )
+            & Q(chapter__number__lte=last_chapter)
         )
 
         if query_filter:
@@ -1107,32 +1158,50 @@ def get_search_result_table(query: dict[str, str]) -> ChapterRefTable | TextRefT
                 type__name__icontains=query_filter
             )
 
+        # Fetch the chapters for every matching RefType in a single query and group
+        # them by RefType, rather than querying the chapters of each RefType
+        rows = reftype_chapters.values_list(
+            "type_id",
+            "type__name",
+            "type__type",
+            "chapter__title",
+            "chapter__source_url",
+        ).order_by("type__name", "type_id", "chapter_id")
+
         table_data = []
-        for rt in ref_types:
-            chapter_data = reftype_chapters.filter(type=rt).values_list(
-                "chapter__title", "chapter__source_url"
+        for _, group in groupby(rows, key=itemgetter(0)):
+            group = list(group)
+            chapter_data = [(title, url) for *_, title, url in group]
+            table_data.append(
+                {
+                    "name": group[0][1],
+                    "type": group[0][2],
+                    "chapter_data": chapter_data,
+                    "count": len(chapter_data),
+                }
             )
 
-            rc_data = {
-                "name": rt.name,
-                "type": rt.type,
-                "chapter_data": chapter_data,
-            }
-
-            rc_data["count"] = len(rc_data["chapter_data"])
-
-            if rc_data["chapter_data"]:
-                table_data.append(rc_data)
-
         table = ChapterRefTable(table_data)
     else:
-        table_data = TextRef.objects.select_related(
-            "type", "chapter_line__chapter"
-        ).annotate(
-            name=F("type__name"),
-            text=F("chapter_line__text"),
-            title=F("chapter_line__chapter__title"),
-            url=F("chapter_line__chapter__source_url"),
+        # Only load the columns TextRefTable renders. The name/text/title/url aliases
+        # are only used for filtering, so they aren't selected a second time
+        table_data = (
+            TextRef.objects.select_related("type", "chapter_line__chapter")
+            .only(
+                "start_column",
+                "end_column",
+                "type__name",
+                "type__type",
+                "chapter_line__text",
+                "chapter_line__chapter__title",
+                "chapter_line__chapter__source_url",
+            )
+            .alias(
+                name=F("type__name"),
+                text=F("chapter_line__text"),
+                title=F("chapter_line__chapter__title"),
+                url=F("chapter_line__chapter__source_url"),
+            )
         )
 
         if reftype := query.get("type"):
@@ -1157,9 +1226,12 @@ def get_search_result_table(query: dict[str, str]) -> ChapterRefTable | TextRefT
                 )
 
         if query.get("text_query"):
-            table_data = table_data.filter(
-                chapter_line__text__icontains=query.get("text_query")
-            )
+            # Match the (smaller) set of chapter lines first and filter the refs by
+            # their line id, rather than testing the text of every joined ref
+            matching_lines = ChapterLine.objects.filter(
+                text__icontains=query.get("text_query")
+            ).values("pk")
+            table_data = table_data.filter(chapter_line_id__in=matching_lines)
 
         if query.get("only_colored_refs"):
             table_data = table_data.filter(color__isnull=False)
@@ -1180,7 +1252,7 @@ def search(request: HtmxHttpRequest) -> HttpResponse:
     if request.method == "GET" and bool(request.GET):
         query = request.GET.copy()
         query["first_chapter"] = query.get("first_chapter", 0)
-        query["last_chapter"] = query.get("last_chapter", MAX_CHAPTER_NUM + 1)
+        query["last_chapter"] = query.get("last_chapter", get_max_chapter_num() + 1)
         query["filter"] = query.get("q")
 
         config = RequestConfig(request)
@@ -1190,7 +1262,7 @@ def search(request: HtmxHttpRequest) -> HttpResponse:
             config.configure(table)
             table.paginate(
                 page=request.GET.get("page", 1),
-                per_page=request.GET.get("page_size", 25),
+                per_page=get_page_size(request),
                 orphans=5,
             )
             return render(request, "tables/htmx_table.html", dict(table=table))
@@ -1201,7 +1273,7 @@ def search(request: HtmxHttpRequest) -> HttpResponse:
             config.configure(table)
             table.paginate(
                 page=request.GET.get("page", 1),
-                per_page=request.GET.get("page_size", 25),
+                per_page=get_page_size(request),
                 orphans=5,
             )
             export_format = request.GET.get("_export", None)
@@ -5,21 +5,54 @@ from datetime import datetime
 from pathlib import Path
 from itertools import chain
 import hashlib
+import json
 import random
 import re
 import string
 from sys import stderr
+import threading
 import time
 from bs4 import BeautifulSoup, ResultSet, Tag
 import requests
 import requests.exceptions
+from requests.adapters import HTTPAdapter
 from stem import Signal
 from stem.control import Controller
 from fake_useragent import UserAgent
+import soupsieve as sv
+from urllib3.util.retry import Retry
 from processing import PatreonChapterError
 
 BASE_URL: str = "https://www.wanderinginn.com"
 
+# CSS selectors run for every chapter or ToC entry are compiled once up front
+ENTRY_CONTENT_SELECTOR = sv.compile(".entry-content")
+ENTRY_TITLE_SELECTOR = sv.compile(".entry-title")
+PUB_TIME_SELECTOR = sv.compile("meta[property='article:published_time']")
+MOD_TIME_SELECTOR = sv.compile("meta[property='article:modified_time']")
+VOLUME_HEADER_SELECTOR = sv.compile(".volume-header")
+BOOK_WRAPPER_SELECTOR = sv.compile(".book-wrapper")
+BOOK_TITLE_SELECTOR = sv.compile(".book-header .head-book-title")
+BOOK_CHAPTER_LINK_SELECTOR = sv.compile(".book-body a")
+
+
+def new_http_session(pool_maxsize: int = 8) -> requests.Session:
+    """Return a requests Session that keeps connections alive and retries
+    transient connection errors"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=3, backoff_factor=0.5),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Shared keep-alive session for requests made outside of a `Session`
+SESSION = new_http_session()
+
 
 def remove_bracketed_ref_number(s: str) -> str:
     """Remove a square bracketed reference number from a string"""
@@ -46,50 +79,65 @@ class Session:
         throttle: float = 2.0,
     ):
         print("> Connecting to session...")
-        self.__session = requests.session()
+        self.__session = new_http_session()
         self.__proxy_port = proxy_port
         self.__tries = 0  # resets after a sucessful chapter download
         self.__max_tries = max_tries
         self.__tor_enabled = tor_enabled
         self.__throttle = throttle
         self.__last_get = 0
+        self.__throttle_lock = threading.Lock()
         if tor_enabled:
             self.set_tor_proxy(proxy_ip)
 
     def get(
-        self, url: str, timeout: int = 10, ignore_throttle: bool = False
+        self,
+        url: str,
+        timeout: int = 10,
+        ignore_throttle: bool = False,
+        headers: dict[str, str] | None = None,
     ) -> requests.Response | None:
         """Perform a GET request to [url]"""
         resp = None
-        # Add jitter to throttle time
-        throttle = random.uniform(0.5, 1.5) * self.__throttle
-        if not ignore_throttle:
-            while time.time() - self.__last_get < throttle:
-                # Note: the timing precision for the throttle should only be to 0.1
-                # Anything beyond that will be effectively ignored due to the sleep
-                time.sleep(0.1)
-        self.__last_get = time.time()
-        while self.__tries < self.__max_tries:
+        while True:
+            # Add jitter to throttle time
+            throttle = random.uniform(0.5, 1.5) * self.__throttle
+            # Only the request start times are serialized so concurrent callers
+            # still respect the throttle while their responses are in flight.
+            # Retries go through the same lock so they're throttled too
+            with self.__throttle_lock:
+                if self.__tries >= self.__max_tries:
+                    break
+                if not ignore_throttle:
+                    while time.time() - self.__last_get < throttle:
+                        # Note: the timing precision for the throttle should only be to 0.1
+                        # Anything beyond that will be effectively ignored due to the sleep
+                        time.sleep(0.1)
+                self.__last_get = time.time()
+
             resp = self.__session.get(
                 url=url,
-                headers={"User-Agent": UserAgent().random},
+                headers={"User-Agent": UserAgent().random} | (headers or {}),
                 allow_redirects=True,
                 timeout=timeout,
             )
 
-            if resp.status_code >= 400 and resp.status_code <= 499:
-                self.__tries += 1
-                if self.__tor_enabled:
-                    print("Get new tor circuit", time.time())
-                    self.get_new_tor_circuit()
-            else:
-                self.__tries = 0
-                return resp
+            with self.__throttle_lock:
+                if resp.status_code >= 400 and resp.status_code <= 499:
+                    self.__tries += 1
+                    # Other workers wait on the lock while the circuit is rotated
+                    if self.__tor_enabled:
+                        print("Get new tor circuit", time.time())
+                        self.get_new_tor_circuit()
+                else:
+                    self.__tries = 0
+                    return resp
 
         print("Cannot re-attempt download. Too many retries. Must reset to continue.")
 
     def reset_tries(self):
-        self.__tries = 0
+        with self.__throttle_lock:
+            self.__tries = 0
 
     def set_tor_proxy(self, ip: str):
         self.__session.proxies = {
@@ -105,7 +153,7 @@ class Session:
 
 
 def extract_chapter_content(soup: BeautifulSoup) -> Tag:
-    content = soup.select_one(".entry-content")
+    content = ENTRY_CONTENT_SELECTOR.select_one(soup)
     if content is None:
         raise ValueError("The Chapter soup contains no .entry-content")
 
@@ -224,7 +272,7 @@ def parse_chapter_response(response: requests.Response) -> dict:
     chapter_data = {}
 
     # Parse chapter metadata from Response object
-    soup: BeautifulSoup = BeautifulSoup(response.content, "html.parser")
+    soup: BeautifulSoup = BeautifulSoup(response.content, "lxml")
 
     try:
         chapter_data = parse_chapter_content(soup)
@@ -232,16 +280,12 @@ def parse_chapter_response(response: requests.Response) -> dict:
         raise
 
     try:
-        title = soup.select(".entry-title")[0].get_text()
-        pub_time = soup.select("meta[property='article:published_time']")[0].get(
-            "content"
-        )
-        mod_time = soup.select("meta[property='article:modified_time']")[0].get(
-            "content"
-        )
+        title = ENTRY_TITLE_SELECTOR.select(soup)[0].get_text()
+        pub_time = PUB_TIME_SELECTOR.select(soup)[0].get("content")
+        mod_time = MOD_TIME_SELECTOR.select(soup)[0].get("content")
         dl_time: str = str(datetime.now().astimezone())
 
-        chapter_data["html"] = str(soup.select_one(".entry-content"))
+        chapter_data["html"] = str(ENTRY_CONTENT_SELECTOR.select_one(soup))
         chapter_data["metadata"] |= {
             "title": title,
             "pub_time": pub_time,
@@ -256,26 +300,37 @@ def parse_chapter_response(response: requests.Response) -> dict:
 
 
 def save_file(filepath: Path, text: str, clobber: bool = False):
-    """Write chapter text content to file"""
-    if filepath.exists() and not clobber:
-        return False
+    """Write chapter text content to file
+
+    An existing file is only overwritten if `clobber` is set and its content
+    differs from `text`"""
+    content = text.encode("utf-8")
+    if filepath.exists():
+        if not clobber:
+            return False
+
+        # Skip rewriting files that are unchanged since the last download
+        if filepath.stat().st_size == len(content) and filepath.read_bytes() == content:
+            return False
 
-    with open(filepath, "w", encoding="utf-8") as file:
-        file.write(text)
-        return True
+    filepath.write_bytes(content)
+    return True
 
 
 class TableOfContents:
     """Table of Contents scraper to query for any needed info"""
 
-    def __init__(self, session: Session | None = None):
+    def __init__(self, session: Session | None = None, cache_dir: Path | None = None):
         self.domain: str = "www.wanderinginn.com"
         self.url: str = f"https://{self.domain}/table-of-contents"
+        self.cache_dir = cache_dir
+        self.__selections: dict[str, ResultSet[Tag]] = {}
+        headers = self.__get_conditional_headers()
         if session:
             assert isinstance(session, Session)
-            self.response = session.get(self.url)
+            self.response = session.get(self.url, headers=headers)
         else:
-            self.response = requests.get(self.url, timeout=10)
+            self.response = SESSION.get(self.url, headers=headers, timeout=10)
             print("Request for Table of Contents timed out!", file=stderr)
 
         self.volume_data: OrderedDict[str, OrderedDict[str, str]]
@@ -290,10 +345,74 @@ class TableOfContents:
             return
 
         # TODO: add check to not download chapter with password prompt
-        self.soup = BeautifulSoup(self.response.content, "html.parser")
+        self.soup = BeautifulSoup(self.__get_content(self.response), "lxml")
         self.chapter_links = self.__get_chapter_links()
         self.volume_data = self.__get_volume_data()
 
+    @property
+    def __cache_html_path(self) -> Path | None:
+        return Path(self.cache_dir, "toc.html") if self.cache_dir else None
+
+    @property
+    def __cache_meta_path(self) -> Path | None:
+        return Path(self.cache_dir, "toc.json") if self.cache_dir else None
+
+    def __get_conditional_headers(self) -> dict[str, str]:
+        """Return `If-None-Match` / `If-Modified-Since` headers for the cached
+        Table of Contents so an unchanged page is answered with a bodiless 304"""
+        html_path, meta_path = self.__cache_html_path, self.__cache_meta_path
+        if html_path is None or meta_path is None:
+            return {}
+        if not html_path.exists() or not meta_path.exists():
+            return {}
+
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+        headers = {}
+        if etag := meta.get("etag"):
+            headers["If-None-Match"] = etag
+        if last_modified := meta.get("last_modified"):
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def __get_content(self, response: requests.Response) -> bytes:
+        """Return the Table of Contents HTML from the cache if it was not modified,
+        otherwise cache and return the content of [response]"""
+        html_path, meta_path = self.__cache_html_path, self.__cache_meta_path
+        if html_path is None or meta_path is None:
+            return response.content
+
+        if response.status_code == 304 and html_path.exists():
+            return html_path.read_bytes()
+
+        # Only a full page is cached so an error response never replaces a good copy
+        if response.status_code != 200:
+            return response.content
+
+        html_path.parent.mkdir(parents=True, exist_ok=True)
+        html_path.write_bytes(response.content)
+        meta_path.write_text(
+            json.dumps(
+                {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+            ),
+            encoding="utf-8",
+        )
+
+        return response.content
+
+    def __select(self, selector: str) -> ResultSet[Tag]:
+        """Return the elements matching [selector], walking the parse tree only
+        once per selector"""
+        if selector not in self.__selections:
+            self.__selections[selector] = self.soup.select(selector)
+        return self.__selections[selector]
+
     def __get_chapter_links(self) -> list[str]:
         """Scrape table of contents for a list of chapter links"""
         if self.soup is None:
@@ -301,7 +420,7 @@ class TableOfContents:
 
         return [
             f"https://{self.domain}" + link.get("href")
-            for link in self.soup.select(".chapter-entry a")
+            for link in self.__select(".chapter-entry a")
         ]
 
     def __get_volume_data(self) -> OrderedDict[str, OrderedDict[str, str]]:
@@ -323,25 +442,25 @@ class TableOfContents:
         if self.soup is None:
             return volumes
 
-        vol_elements = self.soup.select(".volume-wrapper")
+        vol_elements = self.__select(".volume-wrapper")
 
         volumes = OrderedDict()
         for vol_ele in vol_elements:
-            vol_name = vol_ele.select_one(".volume-header").text.strip()
+            vol_name = VOLUME_HEADER_SELECTOR.select_one(vol_ele).text.strip()
             volumes[vol_name] = OrderedDict()
 
             # Search for books
-            book_sections = vol_ele.select(".book-wrapper")
+            book_sections = BOOK_WRAPPER_SELECTOR.select(vol_ele)
             for section in book_sections:
                 # Check for book heading
-                heading_div = section.select_one(".book-header .head-book-title")
+                heading_div = BOOK_TITLE_SELECTOR.select_one(section)
 
                 # Use book title or default to "Unreleased" for sections without a released audiobook
                 book_name = heading_div.text if heading_div else "Unreleased"
 
                 volumes[vol_name][book_name] = OrderedDict()
 
-                chapters = section.select(".book-body a")
+                chapters = BOOK_CHAPTER_LINK_SELECTOR.select(section)
 
                 # Populate chapters for each book by title
                 for chapter in chapters:
@@ -352,7 +471,10 @@ class TableOfContents:
 
     def get_book_titles(self, is_released: bool = False):
         """Get a list of Book titles from TableOfContents"""
+        books = self.__select(".book")
         if is_released:
-            return [x.text.strip() for x in self.soup.select(".book:not(.unreleased)")]
+            return [
+                x.text.strip() for x in books if "unreleased" not in x.get("class", [])
+            ]
         else:
-            return [x.text.strip() for x in self.soup.select(".book")]
+            return [x.text.strip() for x in books]
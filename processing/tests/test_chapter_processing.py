@@ -8,7 +8,7 @@ from pathlib import Path
 def ch1_html_content() -> BeautifulSoup:
     """Sample chapter #1"""
     with open(Path(__file__).parent / "samples/8.00/8.00.html", encoding="utf-8") as fp:
-        soup = BeautifulSoup(fp)
+        soup = BeautifulSoup(fp, "lxml")
         soup.get("html")
         return soup
 
@@ -44,7 +44,7 @@ def ch2_html_content() -> BeautifulSoup:
     with open(
         Path(__file__).parent / "samples/TheRoots3/chapter.html", encoding="utf-8"
     ) as fp:
-        soup = BeautifulSoup(fp)
+        soup = BeautifulSoup(fp, "lxml")
         soup.get("html")
         return soup
 
@@ -82,7 +82,7 @@ def ch3_html_content() -> BeautifulSoup:
     with open(
         Path(__file__).parent / "samples/10.22_R/chapter.html", encoding="utf-8"
     ) as fp:
-        soup = BeautifulSoup(fp)
+        soup = BeautifulSoup(fp, "lxml")
         soup.get("html")
         return soup
 
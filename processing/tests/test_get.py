@@ -0,0 +1,158 @@
+import json
+import os
+from pathlib import Path
+from unittest import mock
+import pytest
+import requests
+from processing.get import Session, TableOfContents, save_file
+
+TOC_HTML = b"""<html><body>
+<div class="volume-wrapper">
+  <div class="volume-header">Volume 1</div>
+  <div class="book-wrapper">
+    <div class="book-header"><div class="head-book-title">Book 1</div></div>
+    <div class="book-body">
+      <a href="https://wanderinginn.com/2016/07/27/1-00/">1.00</a>
+    </div>
+  </div>
+</div>
+</body></html>"""
+
+
+def make_response(
+    status_code: int, content: bytes = b"", headers: dict[str, str] | None = None
+) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers.update(headers or {})
+    return response
+
+
+@pytest.fixture
+def toc_cache(tmp_path) -> Path:
+    """A cached Table of Contents from a previous download"""
+    cache_dir = Path(tmp_path, ".cache")
+    cache_dir.mkdir()
+    Path(cache_dir, "toc.html").write_bytes(TOC_HTML)
+    Path(cache_dir, "toc.json").write_text(
+        json.dumps(
+            {"etag": '"abc123"', "last_modified": "Wed, 01 May 2024 00:00:00 GMT"}
+        ),
+        encoding="utf-8",
+    )
+    return cache_dir
+
+
+# ------------------------------------------------------------------------
+# TableOfContents cache tests
+# ------------------------------------------------------------------------
+def test_toc_conditional_headers_from_cache(toc_cache):
+    """The ToC request should be conditional on the cached ETag and Last-Modified"""
+    session = mock.Mock(spec=Session)
+    session.get.return_value = make_response(304)
+
+    TableOfContents(session, cache_dir=toc_cache)
+
+    session.get.assert_called_once()
+    assert session.get.call_args.kwargs["headers"] == {
+        "If-None-Match": '"abc123"',
+        "If-Modified-Since": "Wed, 01 May 2024 00:00:00 GMT",
+    }
+
+
+def test_toc_not_modified_uses_cache(toc_cache):
+    """A 304 response has no body so the cached ToC should be parsed instead"""
+    session = mock.Mock(spec=Session)
+    session.get.return_value = make_response(304)
+
+    toc = TableOfContents(session, cache_dir=toc_cache)
+
+    assert toc.volume_data == {
+        "Volume 1": {"Book 1": {"1.00": "https://wanderinginn.com/2016/07/27/1-00/"}}
+    }
+    assert Path(toc_cache, "toc.html").read_bytes() == TOC_HTML
+
+
+def test_toc_modified_updates_cache(tmp_path):
+    """A fresh ToC should be cached along with its validators"""
+    session = mock.Mock(spec=Session)
+    session.get.return_value = make_response(
+        200, TOC_HTML, {"ETag": '"def456"', "Last-Modified": "Thu, 02 May 2024"}
+    )
+    cache_dir = Path(tmp_path, ".cache")
+
+    toc = TableOfContents(session, cache_dir=cache_dir)
+
+    assert session.get.call_args.kwargs["headers"] == {}
+    assert list(toc.volume_data) == ["Volume 1"]
+    assert Path(cache_dir, "toc.html").read_bytes() == TOC_HTML
+    assert json.loads(Path(cache_dir, "toc.json").read_text(encoding="utf-8")) == {
+        "etag": '"def456"',
+        "last_modified": "Thu, 02 May 2024",
+    }
+
+
+def test_toc_error_keeps_cache(toc_cache):
+    """An error page shouldn't overwrite the cached ToC or its validators"""
+    session = mock.Mock(spec=Session)
+    session.get.return_value = make_response(
+        503, b"<html>Service Unavailable</html>", {"ETag": '"error"'}
+    )
+    meta = Path(toc_cache, "toc.json").read_text(encoding="utf-8")
+
+    TableOfContents(session, cache_dir=toc_cache)
+
+    assert Path(toc_cache, "toc.html").read_bytes() == TOC_HTML
+    assert Path(toc_cache, "toc.json").read_text(encoding="utf-8") == meta
+
+
+def test_toc_not_modified_without_cache(tmp_path):
+    """A 304 with no cached ToC shouldn't write an empty cache"""
+    session = mock.Mock(spec=Session)
+    session.get.return_value = make_response(304)
+    cache_dir = Path(tmp_path, ".cache")
+
+    toc = TableOfContents(session, cache_dir=cache_dir)
+
+    assert toc.volume_data == {}
+    assert not Path(cache_dir, "toc.html").exists()
+    assert not Path(cache_dir, "toc.json").exists()
+
+
+# ------------------------------------------------------------------------
+# save_file tests
+# ------------------------------------------------------------------------
+def test_save_file_new(tmp_path):
+    path = Path(tmp_path, "chapter.txt")
+    assert save_file(path, "Erin Solstice", clobber=False)
+    assert path.read_text(encoding="utf-8") == "Erin Solstice"
+
+
+def test_save_file_no_clobber(tmp_path):
+    """An existing file should never be overwritten without `clobber`"""
+    path = Path(tmp_path, "chapter.txt")
+    path.write_text("Erin Solstice", encoding="utf-8")
+    assert not save_file(path, "Ryoka Griffin", clobber=False)
+    assert path.read_text(encoding="utf-8") == "Erin Solstice"
+
+
+def test_save_file_clobber_unchanged(tmp_path):
+    """Clobbering a file with identical content should skip the write entirely"""
+    path = Path(tmp_path, "chapter.txt")
+    path.write_text("Erin Solstice", encoding="utf-8")
+    os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+
+    assert not save_file(path, "Erin Solstice", clobber=True)
+    assert path.stat().st_mtime_ns == 1_000_000_000
+
+
+def test_save_file_clobber_changed(tmp_path):
+    """Clobbering a file with new content should overwrite it"""
+    path = Path(tmp_path, "chapter.txt")
+    path.write_text("Erin Solstice", encoding="utf-8")
+    os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+
+    assert save_file(path, "Erin Solstice\n[Innkeeper Level 1!]", clobber=True)
+    assert path.read_text(encoding="utf-8") == "Erin Solstice\n[Innkeeper Level 1!]"
+    assert path.stat().st_mtime_ns != 1_000_000_000
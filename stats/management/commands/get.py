@@ -1,6 +1,8 @@
 """Download command for wanderinginn.com"""
 
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 import json
+import multiprocessing
 from pathlib import Path
 import random
 import time
@@ -11,7 +13,9 @@ from processing import get, PatreonChapterError
 class Command(BaseCommand):
     help = "Download Wandering Inn source text and metadata including volumes, books, chapters"
     last_download: float = 0
-    session = get.Session()
+    session: get.Session
+    writer: ThreadPoolExecutor
+    parse_pool: ProcessPoolExecutor
 
     def add_arguments(self, parser):
         parser.add_argument("volume", nargs="?", type=str, help="Volume to download")
@@ -26,7 +30,13 @@ class Command(BaseCommand):
             action="store_true",
             help="Retrieve volume/book/chapter by indexes instead of title",
         )
-        parser.add_argument("-d", "--request_delay", default=5.0, help="Time delay")
+        parser.add_argument(
+            "-d",
+            "--request_delay",
+            type=float,
+            default=5.0,
+            help="Delay in seconds between requests",
+        )
         parser.add_argument(
             "-j",
             "--jitter",
@@ -57,6 +67,13 @@ class Command(BaseCommand):
         parser.add_argument(
             "-m", "--metadata-only", action="store_true", help="Download only metadata"
         )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=4,
+            help="Maximum number of chapters to download concurrently",
+        )
 
     def save_file(
         self,
@@ -65,7 +82,21 @@ class Command(BaseCommand):
         clobber: bool,
         success_msg: str = "",
         warn_msg: str = "",
-    ):
+    ) -> Future[bool]:
+        """Queue a file to be written by the single writer thread so chapter
+        downloads never block on disk writes"""
+        return self.writer.submit(
+            self.write_file, text, path, clobber, success_msg, warn_msg
+        )
+
+    def write_file(
+        self,
+        text: str,
+        path: Path,
+        clobber: bool,
+        success_msg: str = "",
+        warn_msg: str = "",
+    ) -> bool:
         was_saved = get.save_file(path, text, clobber=clobber)
 
         if was_saved:
@@ -125,7 +156,11 @@ class Command(BaseCommand):
             return
 
         try:
-            data = get.parse_chapter_response(chapter_response)
+            # Parse in a worker process so parsing isn't serialized by the GIL
+            # across the download threads
+            data = self.parse_pool.submit(
+                get.parse_chapter_response, chapter_response
+            ).result()
         except PatreonChapterError:
             self.stdout.write(
                 self.style.WARNING(
@@ -145,43 +180,53 @@ class Command(BaseCommand):
             return
 
         # Save metadata
-        self.save_file(
-            text=json.dumps(data["metadata"], sort_keys=True, indent=4),
-            path=meta_path,
-            clobber=bool(options.get("clobber")),
-            success_msg=f'"{chapter_title}" metadata saved to {meta_path}',
-            warn_msg=f"{meta_path} already exists. Not saving...",
-        )
+        writes = [
+            self.save_file(
+                text=json.dumps(data["metadata"], sort_keys=True, indent=4),
+                path=meta_path,
+                clobber=bool(options.get("clobber")),
+                success_msg=f'"{chapter_title}" metadata saved to {meta_path}',
+                warn_msg=f"{meta_path} already exists. Not saving...",
+            )
+        ]
 
-        if options.get("metadata_only"):
-            return
+        if not options.get("metadata_only"):
+            # Save source HTML
+            writes.append(
+                self.save_file(
+                    text=data["html"],
+                    path=src_path,
+                    clobber=bool(options.get("clobber")),
+                    success_msg=f'"{chapter_title}" html saved to {src_path}',
+                    warn_msg=f"{src_path} already exists. Not saving...",
+                )
+            )
 
-        # Save source HTML
-        self.save_file(
-            text=data["html"],
-            path=src_path,
-            clobber=bool(options.get("clobber")),
-            success_msg=f'"{chapter_title}" html saved to {src_path}',
-            warn_msg=f"{src_path} already exists. Not saving...",
-        )
+            # Save text
+            writes.append(
+                self.save_file(
+                    text=data["text"],
+                    path=txt_path,
+                    clobber=bool(options.get("clobber")),
+                    success_msg=f'"{chapter_title}" text saved to {txt_path}',
+                    warn_msg=f"{txt_path} already exists. Not saving...",
+                )
+            )
 
-        # Save text
-        self.save_file(
-            text=data["text"],
-            path=txt_path,
-            clobber=bool(options.get("clobber")),
-            success_msg=f'"{chapter_title}" text saved to {txt_path}',
-            warn_msg=f"{txt_path} already exists. Not saving...",
-        )
+            # Save author's note
+            writes.append(
+                self.save_file(
+                    text=data["authors_note"],
+                    path=authors_note_path,
+                    clobber=bool(options.get("clobber")),
+                    success_msg=f'"{chapter_title}" text saved to {authors_note_path}',
+                    warn_msg=f"{authors_note_path} already exists. Not saving...",
+                )
+            )
 
-        # Save author's note
-        self.save_file(
-            text=data["authors_note"],
-            path=authors_note_path,
-            clobber=bool(options.get("clobber")),
-            success_msg=f'"{chapter_title}" text saved to {authors_note_path}',
-            warn_msg=f"{authors_note_path} already exists. Not saving...",
-        )
+        # Surface any write error so it stops the download like a synchronous write
+        for write in writes:
+            write.result()
 
         self.last_download = time.time()
 
@@ -197,7 +242,7 @@ class Command(BaseCommand):
             "chapters": {k: i for (i, (k, _)) in enumerate(chapters.items())},
         }
         meta_path = Path(book_path, "metadata.json")
-        self.save_file(
+        meta_write = self.save_file(
             text=json.dumps(metadata, sort_keys=True, indent=4),
             path=meta_path,
             clobber=bool(options.get("clobber")),
@@ -205,11 +250,29 @@ class Command(BaseCommand):
             warn_msg=f"{meta_path} already exists. Not saving...",
         )
 
-        for chapter_title in chapters:
-            chapter_path = Path(book_path, chapter_title)
-            self.download_chapter(
-                toc, options, volume_title, book_title, chapter_title, chapter_path
-            )
+        with ThreadPoolExecutor(max_workers=max(options.get("workers", 1), 1)) as pool:
+            downloads = [
+                pool.submit(
+                    self.download_chapter,
+                    toc,
+                    options,
+                    volume_title,
+                    book_title,
+                    chapter_title,
+                    Path(book_path, chapter_title),
+                )
+                for chapter_title in chapters
+            ]
+            try:
+                for download in downloads:
+                    download.result()
+            except BaseException:
+                # Drop the queued chapters on an interrupt or a failed chapter so
+                # the pool only waits on the downloads already in progress
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+        meta_write.result()
 
     def download_volume(self, toc, options, volume_title: str, volume_path: Path):
         volume_path.mkdir(parents=True, exist_ok=True)
@@ -221,7 +284,7 @@ class Command(BaseCommand):
             "books": {k: i for (i, (k, _)) in enumerate(books.items())},
         }
         meta_path = Path(volume_path, "metadata.json")
-        self.save_file(
+        meta_write = self.save_file(
             text=json.dumps(metadata, sort_keys=True, indent=4),
             path=meta_path,
             clobber=bool(options.get("clobber")),
@@ -233,9 +296,21 @@ class Command(BaseCommand):
             book_path = Path(volume_path, book_title)
             self.download_book(toc, options, volume_title, book_title, book_path)
 
+        meta_write.result()
+
     def handle(self, *args, **options) -> None:
         # TODO: fix Keyboard Exception not working
-        toc = get.TableOfContents(self.session)
+        self.session = get.Session(throttle=options.get("request_delay", 5.0))
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        # Parse workers are started lazily from the download threads, so they're
+        # spawned rather than forked from an already multithreaded process
+        self.parse_pool = ProcessPoolExecutor(
+            max_workers=max(options.get("workers", 1), 1),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        toc = get.TableOfContents(
+            self.session, cache_dir=Path(options.get("root", "./data"), ".cache")
+        )
         if len(toc.volume_data) == 0:
             self.stdout.write(
                 self.style.WARNING(
@@ -281,7 +356,7 @@ class Command(BaseCommand):
                     "volumes": {k: i for i, k in enumerate(toc.volume_data)},
                 }
                 meta_path = Path(volume_root, "metadata.json")
-                self.save_file(
+                meta_write = self.save_file(
                     text=json.dumps(metadata, sort_keys=True, indent=4),
                     path=meta_path,
                     clobber=bool(options.get("clobber")),
@@ -296,6 +371,8 @@ class Command(BaseCommand):
                     # TODO: check for empty volume_title
                     volume_path = Path(volume_root, f"{volume_title}")
                     self.download_volume(toc, options, volume_title, volume_path)
+
+                meta_write.result()
             elif c_title:
                 # Download selected chapter
                 path = Path(volume_root, v_title, b_title, c_title)
@@ -312,6 +389,10 @@ class Command(BaseCommand):
         except KeyboardInterrupt as exc:
             # TODO: file / partial download cleanup
             raise CommandError("Keyboard interrupt...downloads stopped") from exc
+        finally:
+            # Finish any in-flight parsing and flush queued writes
+            self.parse_pool.shutdown(wait=True)
+            self.writer.shutdown(wait=True)
 
         # TODO add pause/resume
         # TODO add type hinting
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stats", "0050_reftype_chapterline_trgm_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE UNIQUE INDEX reftype_computed_view_ref_type_idx
+                ON reftype_computed_view (ref_type);
+            CREATE INDEX reftype_computed_view_mentions_idx
+                ON reftype_computed_view (mentions DESC NULLS LAST);
+            """,
+            """
+            DROP INDEX reftype_computed_view_mentions_idx;
+            DROP INDEX reftype_computed_view_ref_type_idx;
+            """,
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.validators import RegexValidator
 from django.db import models
-from django.db.models.functions import Length
+from django.db.models.functions import Length, Upper
 from django.utils.text import slugify
 import re
 from typing import Any
@@ -187,6 +188,11 @@ class RefType(models.Model):
         indexes = [
             models.Index(fields=["name"]),
             models.Index(fields=["type"]),
+            # Trigram index for case-insensitive `name__icontains` searches
+            GinIndex(
+                OpClass(Upper("name"), name="gin_trgm_ops"),
+                name="reftype_name_upper_trgm",
+            ),
         ]
         ordering = ["name"]
         verbose_name_plural = "Ref Types"
@@ -401,6 +407,14 @@ class Character(models.Model):
         (UNKNOWN, "Unknown"),
     ]
 
+    # Status patterns in match priority order
+    STATUS_DATA: list[tuple[str, re.Pattern[Any]]] = [
+        (ALIVE, re.compile(r"[Aa]live")),
+        (UNDEAD, re.compile(r"[Uu]ndead")),
+        (DEAD, re.compile(r"([Dd]ead|[Dd]eceased)")),
+        (UNKNOWN, re.compile(r"([Uu]nknown|[Uu]n-?clear)")),
+    ]
+
     ref_type = models.OneToOneField(RefType, on_delete=models.CASCADE, primary_key=True)
     first_chapter_appearance = models.ForeignKey(
         Chapter, on_delete=models.CASCADE, null=True
@@ -414,16 +428,11 @@ class Character(models.Model):
         if status is None:
             return Character.UNKNOWN
         status = status.strip()
-        if re.match(r"[Aa]live", status):
-            return Character.ALIVE
-        elif re.match(r"[Uu]ndead", status):
-            return Character.UNDEAD
-        elif re.match(r"([Dd]ead|[Dd]eceased)", status):
-            return Character.DEAD
-        elif re.match(r"([Uu]nknown|[Uu]n-?clear)", status):
-            return Character.UNKNOWN
-        else:
-            return Character.UNKNOWN
+        for code, pattern in Character.STATUS_DATA:
+            if pattern.match(status):
+                return code
+
+        return Character.UNKNOWN
 
     @staticmethod
     def parse_species_str(s: str):
@@ -503,6 +512,13 @@ class ChapterLine(models.Model):
     class Meta:
         verbose_name_plural = "Chapter Lines"
         ordering = ["chapter", "line_number"]
+        indexes = [
+            # Trigram index for case-insensitive `text__icontains` searches
+            GinIndex(
+                OpClass(Upper("text"), name="gin_trgm_ops"),
+                name="chapterline_text_upper_trgm",
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=["chapter", "line_number"], name="unique_chapter_and_line"
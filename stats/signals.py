@@ -0,0 +1,11 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from stats.models import Chapter
+
+
+@receiver([post_save, post_delete], sender=Chapter)
+def invalidate_chapter_cache(sender, **kwargs):
+    """Drop the cached chapter lookups used by the chapter filter forms whenever
+    a Chapter is added, updated or removed"""
+    cache.delete("CHAPTER_CHOICES")